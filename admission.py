@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict, deque, defaultdict
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+# 環境変数をロード
+load_dotenv()
+
+# マッチング処理の同時実行数・待ち行列の設定
+MATCHING_MAX_CONCURRENCY = int(os.getenv("MATCHING_MAX_CONCURRENCY", "2"))
+MATCHING_MAX_QUEUE = int(os.getenv("MATCHING_MAX_QUEUE", "8"))
+MATCHING_MAX_PER_CUSTOMER = int(os.getenv("MATCHING_MAX_PER_CUSTOMER", "2"))
+MATCHING_QUEUE_TIMEOUT = float(os.getenv("MATCHING_QUEUE_TIMEOUT", "30"))
+MATCHING_RETRY_AFTER = int(os.getenv("MATCHING_RETRY_AFTER", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+    """
+    同時実行数を制限し、待ち行列が一杯になったら503で即座に拒否するリミッター
+    待機中のリクエストは顧客ごとのラウンドロビンで実行枠を割り当てる
+    """
+
+    def __init__(self, max_concurrency, max_queue, max_per_key, queue_timeout, retry_after):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_key = max_per_key
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._running = 0
+        self._queued = 0
+        # 顧客キーごとの待ち行列（挿入順でラウンドロビンする）
+        self._waiters = OrderedDict()
+        # 顧客キーごとの実行中＋待機中の件数
+        self._per_key = defaultdict(int)
+        self.metrics = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_per_customer": 0,
+            "rejected_timeout": 0,
+        }
+
+    def stats(self):
+        return {"running": self._running, "queued": self._queued, **self.metrics}
+
+    def _reject(self, reason, detail):
+        self.metrics[reason] += 1
+        logger.warning(f"Matching request rejected ({reason}): {self.stats()}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def _wake_next(self):
+        # 空いた実行枠を、待機している顧客に順番に割り当てる
+        while self._waiters and self._running < self.max_concurrency:
+            key, waiters = self._waiters.popitem(last=False)
+            future = waiters.popleft()
+            if waiters:
+                self._waiters[key] = waiters
+            self._queued -= 1
+            if future.done():
+                continue
+            self._running += 1
+            future.set_result(None)
+
+    def _remove_waiter(self, key, future):
+        waiters = self._waiters.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[key]
+
+    async def acquire(self, key):
+        if self._per_key.get(key, 0) >= self.max_per_key:
+            self._reject("rejected_per_customer", "同時に実行できるマッチング数の上限に達しています")
+
+        if self._running < self.max_concurrency and not self._waiters:
+            self._running += 1
+            self._per_key[key] += 1
+            self.metrics["admitted"] += 1
+            return
+
+        if self._queued >= self.max_queue:
+            self._reject("rejected_queue_full", "マッチング処理が混み合っています。しばらくしてから再試行してください")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        self._queued += 1
+        self._per_key[key] += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # 枠が割り当てられた直後に中断された場合は枠を返却する
+                self._running -= 1
+                self._wake_next()
+            else:
+                self._remove_waiter(key, future)
+            self._decrement_key(key)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("rejected_timeout", "マッチング処理の待ち時間が上限を超えました")
+            raise
+        self.metrics["admitted"] += 1
+
+    def _decrement_key(self, key):
+        self._per_key[key] -= 1
+        if self._per_key[key] <= 0:
+            del self._per_key[key]
+
+    def release(self, key):
+        self._running -= 1
+        self._decrement_key(key)
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+
+# マッチングエンドポイント用のリミッター
+matching_limiter = ConcurrencyLimiter(
+    max_concurrency=MATCHING_MAX_CONCURRENCY,
+    max_queue=MATCHING_MAX_QUEUE,
+    max_per_key=MATCHING_MAX_PER_CUSTOMER,
+    queue_timeout=MATCHING_QUEUE_TIMEOUT,
+    retry_after=MATCHING_RETRY_AFTER,
+)
@@ -0,0 +1,118 @@
+"""
+一覧APIのレスポンス生成コストを計測するベンチマーク
+
+旧実装（ORMオブジェクトを全カラム取得 → dict再構築 → pydantic検証 → 標準json）と
+新実装（必要なカラムのみselect → dict → orjson）を比較し、
+1レスポンスあたりのバイト数とCPU時間を出力する。
+
+実行方法（リポジトリのルートで）:
+    python benchmarks/bench_list_endpoints.py
+"""
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud, models, schemas  # noqa: E402
+
+N_PROJECTS = 200
+VECTOR_DIM = 768
+REPEAT = 20
+
+
+def setup_db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    customer = models.CustomerInformation(
+        customer_name="顧客", company_name="会社", department="部署",
+        email_address="customer@example.com", password="x"
+    )
+    researcher = models.ResearcherInformation(
+        researcher_name="研究者", email_address="researcher@example.com", password="x"
+    )
+    db.add_all([customer, researcher])
+    db.flush()
+    vector = json.dumps([0.123456789] * VECTOR_DIM)
+    for i in range(N_PROJECTS):
+        project = models.ProjectInformation(
+            consultation_category="カテゴリ", project_title=f"案件{i}",
+            consultation_content="相談内容" * 200, research_category="分野",
+            deadline=date(2024, 12, 31), customer_id=customer.customer_id,
+            project_content_vectorization=vector
+        )
+        db.add(project)
+        db.flush()
+        db.add(models.MatchingInformation(
+            project_id=project.project_id, researcher_id=researcher.researcher_id,
+            matching_score=80, request=True, response=False
+        ))
+    db.commit()
+    return db, researcher.researcher_id
+
+
+def old_response(db, researcher_id):
+    # 変更前の crud.get_projects_by_researcher と FastAPI の既定シリアライズを再現
+    projects = db.query(models.ProjectInformation, models.MatchingInformation.matching_id).join(models.MatchingInformation).filter(
+        models.MatchingInformation.researcher_id == researcher_id,
+        models.MatchingInformation.request == True,
+        models.MatchingInformation.response == False
+    ).all()
+    project_details = []
+    for project, matching_id in projects:
+        customer = db.query(models.CustomerInformation).filter(models.CustomerInformation.customer_id == project.customer_id).first()
+        project_details.append({
+            "project_id": project.project_id,
+            "matching_id": matching_id,
+            "consultation_category": project.consultation_category,
+            "project_title": project.project_title,
+            "consultation_content": project.consultation_content,
+            "research_category": project.research_category,
+            "deadline": project.deadline.isoformat() if project.deadline else None,
+            "customer": {
+                "customer_id": customer.customer_id,
+                "customer_name": customer.customer_name,
+                "company_name": customer.company_name,
+                "department": customer.department,
+                "email_address": customer.email_address
+            }
+        })
+    validated = [schemas.ProjectInformation(**p) for p in project_details]
+    return json.dumps(
+        jsonable_encoder(validated), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def new_response(db, researcher_id):
+    projects, _ = crud.get_projects_by_researcher(db, researcher_id, N_PROJECTS)
+    return orjson.dumps(projects)
+
+
+def measure(func, db, researcher_id):
+    body = func(db, researcher_id)
+    start = time.process_time()
+    for _ in range(REPEAT):
+        db.expunge_all()
+        func(db, researcher_id)
+    cpu_ms = (time.process_time() - start) / REPEAT * 1000
+    return len(body), cpu_ms
+
+
+def main():
+    db, researcher_id = setup_db()
+    print(f"projects={N_PROJECTS} vector_dim={VECTOR_DIM} repeat={REPEAT}")
+    for label, func in (("before", old_response), ("after", new_response)):
+        size, cpu_ms = measure(func, db, researcher_id)
+        print(f"{label:>6}: {size:>9} bytes/response  {cpu_ms:8.2f} ms CPU/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import base64
+import json
+from sqlalchemy import select, update, and_, or_
 from sqlalchemy.orm import Session
 import models, schemas
 from passlib.context import CryptContext
@@ -62,85 +65,248 @@ def get_user_by_email(db: Session, email: str):
         user = db.query(models.ResearcherInformation).filter(models.ResearcherInformation.email_address == email).first()
     return user
 
-# 研究者でプロジェクトをソート　オファーの合った案件(update by こばくみ8/21)
-def get_projects_by_researcher(db: Session, researcher_id: int):
-    # ProjectInformationとMatchingInformationを結合し、matching_idも取得するように修正
-    projects = db.query(models.ProjectInformation, models.MatchingInformation.matching_id).join(models.MatchingInformation).filter(
-        models.MatchingInformation.researcher_id == researcher_id,
-        models.MatchingInformation.project_id == models.ProjectInformation.project_id,
-        models.MatchingInformation.request == True,
-        models.MatchingInformation.response == False
-    ).all()
-    
-    project_details = []
-    # 取得したタプルからprojectとmatching_idを取得する
-    for project, matching_id in projects:
-        customer = db.query(models.CustomerInformation).filter(models.CustomerInformation.customer_id == project.customer_id).first()
-        project_detail = {
-            "project_id": project.project_id,
-            "matching_id": matching_id,  # タプルから取得したmatching_idを使用
-            "consultation_category": project.consultation_category,
-            "project_title": project.project_title,
-            "consultation_content": project.consultation_content,
-            "research_category": project.research_category,
-            "deadline": project.deadline.isoformat() if project.deadline else None,
-            "customer": {
-                "customer_id": customer.customer_id,
-                "customer_name": customer.customer_name,
-                "company_name": customer.company_name,
-                "department": customer.department,
-                "email_address": customer.email_address
-            }
+# 一覧表示で返すプロジェクトのカラム（ベクトル列は含めない）
+PROJECT_LIST_COLUMNS = (
+    models.ProjectInformation.project_id,
+    models.MatchingInformation.matching_id,
+    models.MatchingInformation.matching_score,
+    models.ProjectInformation.consultation_category,
+    models.ProjectInformation.project_title,
+    models.ProjectInformation.consultation_content,
+    models.ProjectInformation.research_category,
+    models.ProjectInformation.deadline,
+    models.ProjectInformation.customer_id,
+    models.CustomerInformation.customer_name,
+    models.CustomerInformation.company_name,
+    models.CustomerInformation.department,
+    models.CustomerInformation.email_address,
+)
+
+# 取得した行からレスポンス用のdictを組み立てる（ORMオブジェクトは生成しない）
+def build_project_row(row):
+    customer = None
+    if row.customer_name is not None:
+        customer = {
+            "customer_id": row.customer_id,
+            "customer_name": row.customer_name,
+            "company_name": row.company_name,
+            "department": row.department,
+            "email_address": row.email_address
         }
-        project_details.append(project_detail)
-    
-    return project_details
+    return {
+        "project_id": row.project_id,
+        "matching_id": row.matching_id,
+        "consultation_category": row.consultation_category,
+        "project_title": row.project_title,
+        "consultation_content": row.consultation_content,
+        "research_category": row.research_category,
+        "deadline": row.deadline,
+        "customer_id": row.customer_id,
+        # 一覧ではベクトルを返さないが、response_model と同じキーを揃えておく
+        "project_content_vectorization": None,
+        "customer": customer
+    }
 
-# 研究者でプロジェクトをソート　進行中案件(update by こばくみ8/21)
-def get_filtered_projects_by_researcher(db: Session, researcher_id: int):
-  # ProjectInformationとMatchingInformationを結合し、matching_idも取得するように修正
-    projects = db.query(models.ProjectInformation, models.MatchingInformation.matching_id).join(models.MatchingInformation).filter(
+# ページングカーソルを作成する関数（matching_score, matching_id の組をエンコードする）
+def encode_cursor(matching_score, matching_id):
+    raw = json.dumps([matching_score, matching_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+# ページングカーソルを復元する関数（不正な値の場合は ValueError）
+def decode_cursor(cursor: str):
+    try:
+        matching_score, matching_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(matching_id, int) or not (matching_score is None or isinstance(matching_score, int)):
+        raise ValueError("Invalid cursor")
+    return matching_score, matching_id
+
+# matching_score 降順・matching_id 降順で、カーソルより後ろの行を絞り込む条件
+# （MySQL/SQLiteの降順ではNULLが最後に並ぶため、NULLのスコアは末尾として扱う）
+def _after_cursor(after: tuple):
+    matching_score, matching_id = after
+    if matching_score is None:
+        return and_(models.MatchingInformation.matching_score.is_(None), models.MatchingInformation.matching_id < matching_id)
+    return or_(
+        models.MatchingInformation.matching_score < matching_score,
+        and_(models.MatchingInformation.matching_score == matching_score, models.MatchingInformation.matching_id < matching_id),
+        models.MatchingInformation.matching_score.is_(None)
+    )
+
+# キーセットページングを適用し、(行のリスト, 次ページのカーソル) を返す共通関数
+# after には decode_cursor() で復元した (matching_score, matching_id) を渡す
+def _paginate_by_score(db: Session, stmt, limit: int, after=None):
+    if after is not None:
+        stmt = stmt.where(_after_cursor(after))
+    stmt = stmt.order_by(
+        models.MatchingInformation.matching_score.desc(),
+        models.MatchingInformation.matching_id.desc()
+    ).limit(limit + 1)
+    rows = db.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].matching_score, rows[-1].matching_id)
+    return rows, next_cursor
+
+# 研究者に紐づくプロジェクトを必要なカラムだけ取得する共通関数
+def _get_project_rows_by_researcher(
+    db: Session, researcher_id: int, response: bool, limit: int, after=None,
+    deadline_from=None, deadline_to=None, category=None, min_score=None
+):
+    # 顧客情報も同じクエリで結合し、1件ごとの追加クエリをなくす
+    stmt = select(*PROJECT_LIST_COLUMNS).join(
+        models.MatchingInformation, models.MatchingInformation.project_id == models.ProjectInformation.project_id
+    ).outerjoin(
+        models.CustomerInformation, models.CustomerInformation.customer_id == models.ProjectInformation.customer_id
+    ).where(
         models.MatchingInformation.researcher_id == researcher_id,
-        models.MatchingInformation.project_id == models.ProjectInformation.project_id,
         models.MatchingInformation.request == True,
-        models.MatchingInformation.response == True
-    ).all()
-    
-    project_details = []
-    # 取得したタプルからprojectとmatching_idを取得する
-    for project, matching_id in projects:
-        customer = db.query(models.CustomerInformation).filter(models.CustomerInformation.customer_id == project.customer_id).first()
-        project_detail = {
-            "project_id": project.project_id,
-            "matching_id": matching_id,  # タプルから取得したmatching_idを使用
-            "consultation_category": project.consultation_category,
-            "project_title": project.project_title,
-            "consultation_content": project.consultation_content,
-            "research_category": project.research_category,
-            "deadline": project.deadline.isoformat() if project.deadline else None,
-            "customer": {
-                "customer_id": customer.customer_id,
-                "customer_name": customer.customer_name,
-                "company_name": customer.company_name,
-                "department": customer.department,
-                "email_address": customer.email_address
-            }
-        }
-        project_details.append(project_detail)
-    
-    return project_details
- 
-
-# マッチング情報のresponseを更新する関数
-def accept_offer(db: Session, matching_id: int):
-    matching = db.query(models.MatchingInformation).filter(models.MatchingInformation.matching_id == matching_id).first()
-    if not matching:
+        models.MatchingInformation.response == response
+    )
+    if not response:
+        # 辞退済みのオファーは届いている案件に含めない
+        stmt = stmt.where(_not_declined())
+    # サーバー側での絞り込み条件
+    if deadline_from is not None:
+        stmt = stmt.where(models.ProjectInformation.deadline >= deadline_from)
+    if deadline_to is not None:
+        stmt = stmt.where(models.ProjectInformation.deadline <= deadline_to)
+    if category is not None:
+        stmt = stmt.where(models.ProjectInformation.consultation_category == category)
+    if min_score is not None:
+        stmt = stmt.where(models.MatchingInformation.matching_score >= min_score)
+    rows, next_cursor = _paginate_by_score(db, stmt, limit, after)
+    return [build_project_row(row) for row in rows], next_cursor
+
+# 研究者でプロジェクトをソート　オファーの合った案件(update by こばくみ8/21)
+def get_projects_by_researcher(db: Session, researcher_id: int, limit: int, after=None, **filters):
+    return _get_project_rows_by_researcher(db, researcher_id, False, limit, after, **filters)
+
+# 研究者でプロジェクトをソート　進行中案件(update by こばくみ8/21)
+def get_filtered_projects_by_researcher(db: Session, researcher_id: int, limit: int, after=None, **filters):
+    return _get_project_rows_by_researcher(db, researcher_id, True, limit, after, **filters)
+
+# プロジェクトに紐づくマッチング結果をスコア順に取得する関数
+def get_matching_results(db: Session, project_id: int, limit: int, after=None, min_score=None):
+    stmt = select(
+        models.MatchingInformation.matching_id,
+        models.MatchingInformation.matching_score,
+        models.ProjectInformation.project_title,
+        models.ResearcherInformation.researcher_name,
+        models.ResearcherInformation.name_kana,
+        models.ResearcherInformation.university_research_institution,
+        models.ResearcherInformation.affiliation,
+        models.ResearcherInformation.position,
+        models.ResearcherInformation.kaken_url,
+    ).join(
+        models.ProjectInformation, models.MatchingInformation.project_id == models.ProjectInformation.project_id
+    ).join(
+        models.ResearcherInformation, models.MatchingInformation.researcher_id == models.ResearcherInformation.researcher_id
+    ).where(
+        models.MatchingInformation.project_id == project_id
+    )
+    if min_score is not None:
+        stmt = stmt.where(models.MatchingInformation.matching_score >= min_score)
+    rows, next_cursor = _paginate_by_score(db, stmt, limit, after)
+    return [dict(row._mapping) for row in rows], next_cursor
+
+
+# マッチング情報のresponseを更新する関数（一括受け入れと同じ条件で、本人宛て・未辞退のオファーのみ）
+def accept_offer(db: Session, researcher_id: int, matching_id: int):
+    if not accept_offers(db, researcher_id, [matching_id])[0]["updated"]:
         return None
-    matching.response = True
+    row = db.execute(
+        select(models.MatchingInformation.__table__).where(models.MatchingInformation.matching_id == matching_id)
+    ).first()
+    return dict(row._mapping)
+
+# 複数のマッチング情報を1回のUPDATEでまとめて更新する共通関数
+def _bulk_update_matchings(db: Session, matching_ids: list, conditions: list, values: dict):
+    # MySQLはUPDATE ... RETURNINGに対応していないため、同じ条件で対象行をロックしてから更新する
+    target_ids = set(db.execute(
+        select(models.MatchingInformation.matching_id).where(
+            models.MatchingInformation.matching_id.in_(matching_ids), *conditions
+        ).with_for_update()
+    ).scalars())
+    if target_ids:
+        db.execute(
+            update(models.MatchingInformation).where(
+                models.MatchingInformation.matching_id.in_(target_ids), *conditions
+            ).values(**values).execution_options(synchronize_session=False)
+        )
     db.commit()
-    db.refresh(matching)
-    return matching
+    return [{"matching_id": matching_id, "updated": matching_id in target_ids} for matching_id in matching_ids]
+
+# オファーの状態（matching_information の各カラム）
+#   未オファー : request=False
+#   オファー中 : request=True,  offer_status=True,  response=False, resolution=False
+#   受け入れ   : request=True,  response=True
+#   辞退       : request=True,  offer_status=False, response=False, resolution=True
+# 辞退は request を残したまま resolution=True で記録し、顧客から辞退が見えるようにする
+
+# 辞退済みでないことを表す条件（resolution は NULL の場合もある）
+def _not_declined():
+    return or_(models.MatchingInformation.resolution == False, models.MatchingInformation.resolution.is_(None))
 
-# プロジェクト詳細を表示
-def get_project_details(db: Session, project_id: int):
-    return db.query(models.ProjectInformation).filter(models.ProjectInformation.project_id == project_id).first()
\ No newline at end of file
+# 顧客が自分のプロジェクトのマッチングにまとめてオファーを送る関数（辞退済みには再送しない）
+def request_offers(db: Session, customer_id: int, matching_ids: list):
+    own_projects = select(models.ProjectInformation.project_id).where(models.ProjectInformation.customer_id == customer_id)
+    return _bulk_update_matchings(
+        db, matching_ids,
+        [models.MatchingInformation.project_id.in_(own_projects), _not_declined()],
+        {"request": True, "offer_status": True}
+    )
+
+# 研究者が届いているオファーをまとめて受け入れる関数（辞退済みのものは受け入れない）
+def accept_offers(db: Session, researcher_id: int, matching_ids: list):
+    return _bulk_update_matchings(
+        db, matching_ids,
+        [
+            models.MatchingInformation.researcher_id == researcher_id,
+            models.MatchingInformation.request == True,
+            _not_declined()
+        ],
+        {"response": True}
+    )
+
+# 研究者が未回答のオファーをまとめて辞退する関数
+def decline_offers(db: Session, researcher_id: int, matching_ids: list):
+    return _bulk_update_matchings(
+        db, matching_ids,
+        [
+            models.MatchingInformation.researcher_id == researcher_id,
+            models.MatchingInformation.request == True,
+            models.MatchingInformation.response == False,
+            _not_declined()
+        ],
+        {"offer_status": False, "resolution": True}
+    )
+
+# プロジェクト詳細を表示（ベクトルは include_vectors=True の場合のみ取得）
+def get_project_details(db: Session, project_id: int, include_vectors: bool = False):
+    columns = [
+        models.ProjectInformation.project_id,
+        models.ProjectInformation.consultation_category,
+        models.ProjectInformation.project_title,
+        models.ProjectInformation.consultation_content,
+        models.ProjectInformation.research_category,
+        models.ProjectInformation.deadline,
+        models.ProjectInformation.customer_id,
+    ]
+    if include_vectors:
+        columns.append(models.ProjectInformation.project_content_vectorization)
+    row = db.execute(
+        select(*columns).where(models.ProjectInformation.project_id == project_id)
+    ).first()
+    if row is None:
+        return None
+    # response_model（schemas.ProjectInformation）と同じキーを返す（未取得の項目はNone）
+    project = {
+        "matching_id": None,
+        "project_content_vectorization": None,
+        "customer": None,
+    }
+    project.update(row._mapping)
+    return project
@@ -1,4 +1,8 @@
 import os
+import hashlib
+import hmac
+import math
+import time
 import logging
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
@@ -15,11 +19,20 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 SSL_CA_PATH = os.getenv("SSL_CA_PATH")
 
-# SSLパスのオプション化
-if SSL_CA_PATH:
-    DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}?ssl_ca={SSL_CA_PATH}"
-else:
-    DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+# 読み取り専用レプリカの接続先（未設定の場合はプライマリを使う）
+READER_DB_HOST = os.getenv("READER_DB_HOST")
+# 書き込み直後のユーザーをプライマリから読ませる秒数
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", "5"))
+
+def build_mysql_url(host):
+    # SSLパスのオプション化
+    if SSL_CA_PATH:
+        return f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{host}/{DB_NAME}?ssl_ca={SSL_CA_PATH}"
+    return f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{host}/{DB_NAME}"
+
+# DATABASE_URL / READER_DATABASE_URL が指定されていれば優先する（ローカル検証用にSQLiteも指定可能）
+DATABASE_URL = os.getenv("DATABASE_URL") or build_mysql_url(DB_HOST)
+READER_DATABASE_URL = os.getenv("READER_DATABASE_URL") or (build_mysql_url(READER_DB_HOST) if READER_DB_HOST else None)
 
 # ログの設定
 logging.basicConfig(level=logging.INFO)
@@ -37,9 +50,52 @@ except Exception as e:
 if engine is None:
     raise ValueError("Engine creation failed. Check your DATABASE_URL and database settings.")
 
+# 読み取り用エンジンを作成（レプリカ未設定の場合はプライマリと共有）
+if READER_DATABASE_URL:
+    reader_engine = create_engine(READER_DATABASE_URL)
+    logger.info("Reader database engine created successfully.")
+else:
+    reader_engine = engine
+
 
 # セッションの作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReaderSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=reader_engine)
+
+# 書き込み直後にプライマリから読ませる期限は、署名付きの値としてクライアント側に持たせる
+# （複数ワーカー間でも同じ判定になるよう、プロセス内には状態を持たない）
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary-Until"
+_READ_PRIMARY_SECRET = (os.getenv("SECRET_KEY") or "").encode("utf-8")
+
+def _sign_read_primary(deadline):
+    return hmac.new(_READ_PRIMARY_SECRET, deadline.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def mark_recent_write(response):
+    # レスポンスにCookieとヘッダーで「この時刻まではプライマリから読む」期限を付ける
+    # フロントエンドは別オリジン（クロスサイト）から fetch するため、Cookie は SameSite=None; Secure にする。
+    # Cookie を送れないクライアント（credentials なしの fetch 等）は、受け取った X-Read-Primary-Until を
+    # 次の読み取りリクエストのヘッダーにそのまま付けて送る。
+    if reader_engine is engine:
+        return
+    deadline = f"{time.time() + READ_AFTER_WRITE_SECONDS:.3f}"
+    token = f"{deadline}.{_sign_read_primary(deadline)}"
+    response.set_cookie(
+        READ_PRIMARY_COOKIE, token, max_age=math.ceil(READ_AFTER_WRITE_SECONDS),
+        httponly=True, secure=True, samesite="none"
+    )
+    response.headers[READ_PRIMARY_HEADER] = token
+
+def should_read_primary(token):
+    if not token:
+        return False
+    deadline, _, signature = token.rpartition(".")
+    if not deadline or not hmac.compare_digest(signature, _sign_read_primary(deadline)):
+        return False
+    try:
+        return float(deadline) > time.time()
+    except ValueError:
+        return False
 
 # デクラレーティブベースの作成
 Base = declarative_base()
@@ -59,4 +115,4 @@ def get_db():
     finally:
         if db:
             db.close()
-            logger.info("Database connection closed.")
\ No newline at end of file
+            logger.info("Database connection closed.")
@@ -0,0 +1,175 @@
+"""
+埋め込みモデルを1プロセスで保持し、Unixドメインソケット経由でベクトル化を提供するサイドカー
+
+複数のWebワーカーがそれぞれSentenceTransformerを読み込むとメモリがワーカー数分必要になるため、
+モデルはこのプロセスだけが持ち、ワーカーは encode_via_socket() でベクトルを取得する。
+
+起動方法:
+    EMBEDDING_SOCKET_PATH=/tmp/embedding.sock python embedding_server.py
+
+プロトコル（整数はすべてリトルエンディアンのuint32）:
+    リクエスト: テキスト数 N, 続いて N 個の (バイト長, UTF-8バイト列)
+    レスポンス: ベクトル数 N, 次元数 D, 続いて N*D 個のfloat32（エラー時は N=0, D=0）
+"""
+import asyncio
+import logging
+import os
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+# 環境変数をロード
+load_dotenv()
+
+EMBEDDING_SOCKET_PATH = os.getenv("EMBEDDING_SOCKET_PATH")
+EMBEDDING_SOCKET_TIMEOUT = float(os.getenv("EMBEDDING_SOCKET_TIMEOUT", "10"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+UINT32 = struct.Struct("<I")
+RESPONSE_HEADER = struct.Struct("<II")
+
+logger = logging.getLogger(__name__)
+
+
+def _recv_exactly(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def encode_via_socket(texts, socket_path=None, timeout=None):
+    """
+    埋め込みサーバーにテキストを送り、(テキスト数, 次元数) のfloat32配列を受け取る
+    接続失敗・タイムアウト時は OSError、サーバー側のエラー時は ValueError を送出する
+    """
+    socket_path = socket_path or EMBEDDING_SOCKET_PATH
+    payload = [UINT32.pack(len(texts))]
+    for text in texts:
+        encoded = text.encode("utf-8")
+        payload.append(UINT32.pack(len(encoded)))
+        payload.append(encoded)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout if timeout is not None else EMBEDDING_SOCKET_TIMEOUT)
+        sock.connect(socket_path)
+        sock.sendall(b"".join(payload))
+        count, dim = RESPONSE_HEADER.unpack(_recv_exactly(sock, RESPONSE_HEADER.size))
+        if count != len(texts):
+            raise ValueError("Embedding server returned an error")
+        body = _recv_exactly(sock, count * dim * 4)
+    return np.frombuffer(body, dtype="<f4").reshape(count, dim)
+
+
+class EmbeddingBatcher:
+    """
+    同時に届いたリクエストを最大 max_batch 件まで束ねて1回の encode で処理する
+    """
+
+    def __init__(self, model, max_batch=EMBEDDING_MAX_BATCH, batch_wait_ms=EMBEDDING_BATCH_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue = asyncio.Queue()
+        # モデルの推論は1スレッドで順番に実行する
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def encode(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    def _encode(self, texts):
+        return np.asarray(self.model.encode(texts), dtype="<f4")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            count = len(items[0][0])
+            deadline = loop.time() + self.batch_wait
+            while count < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                count += len(item[0])
+
+            all_texts = [text for texts, _ in items for text in texts]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self._encode, all_texts)
+            except Exception as e:
+                logger.error(f"Embedding failed: {e}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for texts, future in items:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+
+async def _read_request(reader):
+    (count,) = UINT32.unpack(await reader.readexactly(UINT32.size))
+    texts = []
+    for _ in range(count):
+        (size,) = UINT32.unpack(await reader.readexactly(UINT32.size))
+        texts.append((await reader.readexactly(size)).decode("utf-8"))
+    return texts
+
+
+def make_handler(batcher):
+    async def handle(reader, writer):
+        try:
+            texts = await _read_request(reader)
+            try:
+                vectors = await batcher.encode(texts) if texts else np.zeros((0, 0), dtype="<f4")
+            except Exception:
+                writer.write(RESPONSE_HEADER.pack(0, 0))
+            else:
+                count, dim = vectors.shape
+                writer.write(RESPONSE_HEADER.pack(count, dim))
+                writer.write(vectors.tobytes())
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(model, socket_path):
+    batcher = EmbeddingBatcher(model)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(make_handler(batcher), path=socket_path)
+    os.chmod(socket_path, 0o600)
+    logger.info(f"Embedding server listening on {socket_path}")
+    batch_task = asyncio.create_task(batcher.run())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if not EMBEDDING_SOCKET_PATH:
+        raise SystemExit("EMBEDDING_SOCKET_PATH is not set")
+    from matching import load_embedding_model
+    asyncio.run(serve(load_embedding_model(), EMBEDDING_SOCKET_PATH))
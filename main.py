@@ -1,12 +1,16 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from database import engine, get_db, Base, SessionLocal
+from database import engine, reader_engine, get_db, Base, SessionLocal, ReaderSessionLocal, mark_recent_write, should_read_primary, READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER
 import models, schemas, crud
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
+from admission import matching_limiter
+from profiling import install_profiling, tracked
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 
 import os
@@ -37,8 +41,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", READ_PRIMARY_HEADER],
 )
 
+# リクエスト単位のプロファイリング（PROFILING_ENABLED が有効な場合のみ登録される）
+install_profiling(app, [engine, reader_engine])
+
+# 一覧APIの1ページあたりの件数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 # データベースセッションを取得する依存関係
 def get_db():
     db = SessionLocal()
@@ -47,8 +59,35 @@ def get_db():
     finally:
         db.close()
 
+# 読み取り専用エンドポイント用のセッションを取得する依存関係
+# 直前に書き込みを行ったユーザーはレプリカの遅延を避けるためプライマリから読む
+def get_read_db(request: Request):
+    token = request.cookies.get(READ_PRIMARY_COOKIE) or request.headers.get(READ_PRIMARY_HEADER)
+    if should_read_primary(token):
+        db = SessionLocal()
+    else:
+        db = ReaderSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# ページングカーソルのクエリパラメーターを復元する（不正な値は400）
+def decode_cursor_param(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return crud.decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# 一覧APIのレスポンスを作成する（次ページのカーソルは X-Next-Cursor ヘッダーで返す）
+def paginated_response(rows, next_cursor):
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(rows, headers=headers)
+
 # ユーザー情報を取得するユーティリティ関数
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -61,6 +100,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return get_user_from_token(token, db)
+
+# 読み取り専用エンドポイント用（ユーザー情報もレプリカから取得する）
+def get_current_reader(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    return get_user_from_token(token, db)
+
+def get_user_from_token(token: str, db: Session):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -89,10 +135,11 @@ def read_root():
 
 # 顧客情報を新規登録するエンドポイント
 @app.post("/customers/", response_model=schemas.Customer)
-def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+def create_customer(customer: schemas.CustomerCreate, response: Response, db: Session = Depends(get_db)):
     db_customer = crud.create_customer(db, customer)
     if db_customer is None:
         raise HTTPException(status_code=400, detail="Customer already registered")
+    mark_recent_write(response)
     return db_customer
 
 # 顧客のログインを処理し、JWTトークンを返すエンドポイント
@@ -109,10 +156,11 @@ def login_customer(customer: schemas.CustomerLogin, db: Session = Depends(get_db
 
 # 研究者情報を新規登録するエンドポイント
 @app.post("/researchers/", response_model=schemas.Researcher)
-def create_researcher(researcher: schemas.ResearcherCreate, db: Session = Depends(get_db)):
+def create_researcher(researcher: schemas.ResearcherCreate, response: Response, db: Session = Depends(get_db)):
     db_researcher = crud.create_researcher(db, researcher)
     if db_researcher is None:
         raise HTTPException(status_code=400, detail="Researcher already registered")
+    mark_recent_write(response)
     return db_researcher
 
 # 研究者のログインを処理し、JWTトークンを返すエンドポイント
@@ -129,48 +177,120 @@ def login_researcher(researcher: schemas.ResearcherLogin, db: Session = Depends(
 
 # ログインした顧客の情報を取得するエンドポイント
 @app.get("/customers/me/", response_model=schemas.Customer)
-def read_customers_me(current_customer: schemas.Customer = Depends(get_current_user)):
+def read_customers_me(current_customer: schemas.Customer = Depends(get_current_reader)):
     return current_customer
 
 # ログインした研究者の情報を取得するエンドポイント
 @app.get("/researchers/me/", response_model=schemas.Researcher)
-def read_researchers_me(current_researcher: schemas.Researcher = Depends(get_current_user)):
+def read_researchers_me(current_researcher: schemas.Researcher = Depends(get_current_reader)):
     return current_researcher
 
 # ログインした研究者がオファーがあったプロジェクトの詳細を取得するエンドポイント
 @app.get("/researchers/projects", response_model=List[schemas.ProjectInformation])
 async def get_researcher_projects(
-    db: Session = Depends(get_db),
-    current_user: models.ResearcherInformation = Depends(get_current_user)
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    deadline_from: Optional[date] = None,
+    deadline_to: Optional[date] = None,
+    category: Optional[str] = None,
+    min_score: Optional[int] = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.ResearcherInformation = Depends(get_current_reader)
 ):
-    projects = crud.get_projects_by_researcher(db, current_user.researcher_id)
-    return projects
+    after = decode_cursor_param(cursor)
+    projects, next_cursor = crud.get_projects_by_researcher(
+        db, current_user.researcher_id, limit, after,
+        deadline_from=deadline_from, deadline_to=deadline_to, category=category, min_score=min_score
+    )
+    # 取得済みのdictをそのままorjsonでシリアライズする
+    return paginated_response(projects, next_cursor)
 
 # ログインした研究者が進行中のプロジェクトの詳細を取得するエンドポイント 
 @app.get("/researchers/projects/filtered", response_model=List[schemas.ProjectInformation])
 async def get_filtered_researcher_projects(
-    db: Session = Depends(get_db),
-    current_user: models.ResearcherInformation = Depends(get_current_user)
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    deadline_from: Optional[date] = None,
+    deadline_to: Optional[date] = None,
+    category: Optional[str] = None,
+    min_score: Optional[int] = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.ResearcherInformation = Depends(get_current_reader)
 ):
-    projects = crud.get_filtered_projects_by_researcher(db, current_user.researcher_id)
-    return projects
+    after = decode_cursor_param(cursor)
+    projects, next_cursor = crud.get_filtered_projects_by_researcher(
+        db, current_user.researcher_id, limit, after,
+        deadline_from=deadline_from, deadline_to=deadline_to, category=category, min_score=min_score
+    )
+    # 取得済みのdictをそのままorjsonでシリアライズする
+    return paginated_response(projects, next_cursor)
 
 # 研究者がオファーを受け入れるAPI
 @app.post("/researchers/accept-offer/{matching_id}", response_model=schemas.MatchingInformation)
 async def accept_offer(
     matching_id: int,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.ResearcherInformation = Depends(get_current_user)
 ):
-    matching = crud.accept_offer(db, matching_id)
+    if not isinstance(current_user, models.ResearcherInformation):
+        raise HTTPException(status_code=403, detail="研究者アカウントでログインしてください")
+    matching = crud.accept_offer(db, current_user.researcher_id, matching_id)
     if not matching:
         raise HTTPException(status_code=404, detail="Matching not found")
+    mark_recent_write(response)
     return matching
 
 
+# 顧客が複数のマッチングにまとめてオファーを送るAPI
+@app.post("/customers/offers/request", response_model=List[schemas.BulkOfferResult])
+def request_offers(
+    offers: schemas.BulkOfferRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.CustomerInformation = Depends(get_current_user)
+):
+    if not isinstance(current_user, models.CustomerInformation):
+        raise HTTPException(status_code=403, detail="顧客アカウントでログインしてください")
+    matching_ids = list(dict.fromkeys(offers.matching_ids))
+    results = crud.request_offers(db, current_user.customer_id, matching_ids)
+    mark_recent_write(response)
+    return results
+
+# 研究者が複数のオファーをまとめて受け入れるAPI
+@app.post("/researchers/offers/accept", response_model=List[schemas.BulkOfferResult])
+def accept_offers(
+    offers: schemas.BulkOfferRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.ResearcherInformation = Depends(get_current_user)
+):
+    if not isinstance(current_user, models.ResearcherInformation):
+        raise HTTPException(status_code=403, detail="研究者アカウントでログインしてください")
+    matching_ids = list(dict.fromkeys(offers.matching_ids))
+    results = crud.accept_offers(db, current_user.researcher_id, matching_ids)
+    mark_recent_write(response)
+    return results
+
+# 研究者が複数のオファーをまとめて辞退するAPI
+@app.post("/researchers/offers/decline", response_model=List[schemas.BulkOfferResult])
+def decline_offers(
+    offers: schemas.BulkOfferRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.ResearcherInformation = Depends(get_current_user)
+):
+    if not isinstance(current_user, models.ResearcherInformation):
+        raise HTTPException(status_code=403, detail="研究者アカウントでログインしてください")
+    matching_ids = list(dict.fromkeys(offers.matching_ids))
+    results = crud.decline_offers(db, current_user.researcher_id, matching_ids)
+    mark_recent_write(response)
+    return results
+
+
 # プロジェクト情報を新規登録するエンドポイント
 @app.post("/api/projects", response_model=schemas.ProjectInformation)
-def create_project(project: schemas.ProjectInformationCreate, db: Session = Depends(get_db), current_user: models.CustomerInformation = Depends(get_current_user)):
+def create_project(project: schemas.ProjectInformationCreate, response: Response, db: Session = Depends(get_db), current_user: models.CustomerInformation = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="ログインが必要です")
 
@@ -185,15 +305,21 @@ def create_project(project: schemas.ProjectInformationCreate, db: Session = Depe
     db.add(db_project)
     db.commit()
     db.refresh(db_project)  # この時点で project_id が自動的に設定されます
+    mark_recent_write(response)
     return db_project
 
 # 特定のプロジェクト情報を取得するエンドポイント
 @app.get("/api/projects/{project_id}", response_model=schemas.ProjectInformation)
-def get_project(project_id: int, db: Session = Depends(get_db)):
-    project = db.query(models.ProjectInformation).filter(models.ProjectInformation.project_id == project_id).first()
+def get_project(project_id: int, include_vectors: bool = False, db: Session = Depends(get_read_db)):
+    # ベクトルは明示的に要求された場合のみ返す
+    project = crud.get_project_details(db, project_id, include_vectors=include_vectors)
+    if not project and db.get_bind() is not engine:
+        # 作成直後でレプリカに未反映の可能性があるため、プライマリでも確認する
+        with SessionLocal() as primary_db:
+            project = crud.get_project_details(primary_db, project_id, include_vectors=include_vectors)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    return project
+    return ORJSONResponse(project)
 
 # # 新規: 研究者を提案するエンドポイント
 # @app.post("/api/projects/{project_id}/match-researchers", response_model=List[schemas.MatchingResult])
@@ -245,6 +371,7 @@ def get_project(project_id: int, db: Session = Depends(get_db)):
 @app.post("/api/projects/{project_id}/match-researchers", response_model=List[schemas.MatchingResult])
 async def match_researchers(
     project_id: int,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.CustomerInformation = Depends(get_current_user)
 ):
@@ -252,16 +379,23 @@ async def match_researchers(
     project = db.query(models.ProjectInformation).filter(models.ProjectInformation.project_id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    project_title = project.project_title
+    consultation_content = project.consultation_content
+    customer_key = getattr(current_user, "customer_id", None) or current_user.email_address
+    # 待ち行列やベクトル化の間DB接続を握らないよう、読み取りのトランザクションを終えて接続をプールに返す
+    db.rollback()
     
     # マッチングアルゴリズムを実行
-    from .matching import run_matching_algorithm
-    matching_results_raw = run_matching_algorithm(project.consultation_content)
+    # 同時実行数を制限し、CPU負荷の高い処理はスレッドプールで実行してイベントループを塞がない
+    from matching import run_matching_algorithm
+    async with matching_limiter.slot(customer_key):
+        matching_results_raw = await run_in_threadpool(tracked(run_matching_algorithm), consultation_content)
 
     # 結果をスキーマに合わせて整形
     matching_results = []
     for result in matching_results_raw:
         matching_result = {
-            "project_title": project.project_title,  # プロジェクトのタイトルを追加
+            "project_title": project_title,  # プロジェクトのタイトルを追加
             "matching_score": result['score'],  # スコアをマッチングスコアとして使用
             "researcher_name": result.get('researcher_name', 'Unknown'),
             "name_kana": result.get('name_kana', ''),
@@ -286,9 +420,15 @@ async def match_researchers(
         db.add(db_matching)
 
     db.commit()
+    mark_recent_write(response)
     return matching_results
 
 
+# マッチング処理の流量制御の状況を取得するエンドポイント
+@app.get("/metrics/matching")
+def get_matching_metrics():
+    return matching_limiter.stats()
+
 # プロジェクトIDに紐づくマッチング結果を取得するエンドポイント
 # @app.get("/api/projects/{project_id}/matching", response_model=List[schemas.MatchingResult])
 # async def get_matching_results(
@@ -305,31 +445,21 @@ async def match_researchers(
 @app.get("/api/projects/{project_id}/matching", response_model=List[schemas.MatchingResult])
 async def get_matching_results(
     project_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.CustomerInformation = Depends(get_current_user)
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    min_score: Optional[int] = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.CustomerInformation = Depends(get_current_reader)
 ):
-    # Join MatchingInformation with ResearcherInformation and ProjectInformation
-    matching_results = db.query(
-        models.MatchingInformation.matching_score,
-        models.ProjectInformation.project_title,
-        models.ResearcherInformation.researcher_name,
-        models.ResearcherInformation.name_kana,
-        models.ResearcherInformation.university_research_institution,
-        models.ResearcherInformation.affiliation,
-        models.ResearcherInformation.position,
-        models.ResearcherInformation.kaken_url,
-    ).join(
-        models.ProjectInformation, models.MatchingInformation.project_id == models.ProjectInformation.project_id
-    ).join(
-        models.ResearcherInformation, models.MatchingInformation.researcher_id == models.ResearcherInformation.researcher_id
-    ).filter(
-        models.MatchingInformation.project_id == project_id
-    ).all()
-
-    if not matching_results:
+    # マッチングスコアの高い順に、カーソル以降の結果を取得する
+    after = decode_cursor_param(cursor)
+    matching_results, next_cursor = crud.get_matching_results(db, project_id, limit, after, min_score=min_score)
+
+    # 絞り込みなしの1ページ目が空の場合のみ、マッチング結果が存在しないとして404を返す
+    if not matching_results and cursor is None and min_score is None:
         raise HTTPException(status_code=404, detail="Matching results not found")
     
-    return matching_results
+    return paginated_response(matching_results, next_cursor)
 
 
 
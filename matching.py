@@ -1,11 +1,31 @@
+import logging
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 from database_mongo import get_mongo_collection
+from embedding_server import EMBEDDING_SOCKET_PATH, encode_via_socket
+
+EMBEDDING_MODEL_NAME = 'nomic-ai/nomic-embed-text-v1'
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
+def load_embedding_model():
+    """
+    埋め込みモデルを読み込む関数（プロセス内で1回だけ読み込む）
+    """
+    return SentenceTransformer(EMBEDDING_MODEL_NAME, trust_remote_code=True)
 
 def get_embedding(text):
     """
     相談内容をベクトル化するための関数
+    埋め込みサーバーが設定されていればそちらを使い、失敗した場合はプロセス内で計算する
     """
-    model = SentenceTransformer('nomic-ai/nomic-embed-text-v1', trust_remote_code=True)
+    if EMBEDDING_SOCKET_PATH:
+        try:
+            return encode_via_socket([text])[0].tolist()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Embedding server unavailable, falling back to in-process model: {e}")
+    model = load_embedding_model()
     embedding = model.encode(text)
     return embedding.tolist()
 
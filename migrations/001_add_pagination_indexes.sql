@@ -0,0 +1,18 @@
+-- 一覧APIのキーセットページングと絞り込み用のインデックス（MySQL）
+-- models.py の __table_args__ と同じ定義。create_all は既存テーブルにインデックスを追加しないため、
+-- 既存のデータベースには次のコマンドで1回だけ適用する。
+--   mysql -h $DB_HOST -u $DB_USER -p $DB_NAME < migrations/001_add_pagination_indexes.sql
+
+-- /researchers/projects, /researchers/projects/filtered（研究者・オファー状態で絞り込み、スコア降順・ID降順）
+CREATE INDEX ix_matching_researcher_status_score
+    ON matching_information (researcher_id, request, response, matching_score, matching_id);
+
+-- /api/projects/{project_id}/matching（プロジェクトで絞り込み、スコア降順・ID降順）
+CREATE INDEX ix_matching_project_score
+    ON matching_information (project_id, matching_score, matching_id);
+
+-- 締切日・カテゴリでの絞り込み
+CREATE INDEX ix_project_deadline
+    ON project_information (deadline);
+CREATE INDEX ix_project_category_deadline
+    ON project_information (consultation_category, deadline);
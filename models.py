@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Date, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Date, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -45,6 +45,12 @@ class MatchingInformation(Base):
     researcher = relationship("ResearcherInformation", back_populates="matching_projects")
     project = relationship("ProjectInformation", back_populates="matchings")
 
+    # 一覧APIのキーセットページング（スコア降順・ID降順）用のインデックス
+    __table_args__ = (
+        Index("ix_matching_researcher_status_score", "researcher_id", "request", "response", "matching_score", "matching_id"),
+        Index("ix_matching_project_score", "project_id", "matching_score", "matching_id"),
+    )
+
 # プロジェクト情報のモデル
 class ProjectInformation(Base):
     __tablename__ = 'project_information'
@@ -59,3 +65,9 @@ class ProjectInformation(Base):
     project_content_vectorization = Column(Text, nullable=True)
     customer = relationship("CustomerInformation", back_populates="projects")
     matchings = relationship("MatchingInformation", back_populates="project")
+
+    # 締切日・カテゴリでの絞り込み用のインデックス
+    __table_args__ = (
+        Index("ix_project_deadline", "deadline"),
+        Index("ix_project_category_deadline", "consultation_category", "deadline"),
+    )
@@ -0,0 +1,317 @@
+"""
+本番環境で特定のリクエストだけをプロファイルするための仕組み
+
+PROFILING_ENABLED=true のときだけミドルウェアとSQLイベントを登録するため、無効時のオーバーヘッドはない。
+有効時は次のいずれかに該当するリクエストをサンプリングプロファイラで計測する。
+    - X-Profile ヘッダーの値が PROFILING_TOKEN と一致する
+    - PROFILING_SAMPLE_RATE の確率で選ばれた
+
+サンプリング対象のスレッドは次のとおりで、いずれも待機中のスタックは除外する。
+    - スレッドプールのスレッドは、このリクエストの処理を実行している間だけ対象にする
+      （同期エンドポイント・SQL実行・tracked() で包んだ処理。終わればプールに戻る前に対象から外す）
+    - イベントループのスレッドは計測中ずっと対象にする。イベントループは全リクエストで共有されるため、
+      このスレッドのサンプルは同時に処理されている他のリクエストの非同期処理も含む（リクエスト単位ではなくスレッド単位）
+
+保存するプロファイルのファイル数は PROFILING_MAX_FILES までとし、超えた分は古いものから削除する。
+
+結果は PROFILING_DIR に リクエストID をファイル名として保存する。
+    <request_id>.collapsed : flamegraph.pl / speedscope で読み込める collapsed stack 形式
+    <request_id>.json      : 処理時間・サンプル数・SQLの実行回数と所要時間
+リクエストIDは X-Request-ID ヘッダー（なければ自動採番）で、レスポンスの X-Profile-Id ヘッダーで返す。
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from sqlalchemy import event
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+# 環境変数をロード
+load_dotenv()
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+PROFILE_FILE_SUFFIXES = (".collapsed", ".json")
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# 待機中とみなすスタックの末端（ファイル名, 関数名）
+IDLE_LEAF_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+}
+
+logger = logging.getLogger(__name__)
+
+# 計測中のリクエストの情報（計測対象外のリクエストではNone）
+_current_profile = ContextVar("current_profile", default=None)
+
+# 同時に計測するリクエストは1件に限定する
+_profile_lock = threading.Lock()
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAF_FRAMES
+
+
+class StackSampler:
+    """
+    別スレッドから一定間隔で対象スレッドのスタックを取得し、collapsed stack ごとに集計する
+    """
+
+    def __init__(self, thread_ids, interval_ms=PROFILING_INTERVAL_MS):
+        # thread_ids（スレッドID → 実行中の処理数）は計測中に増減するため、サンプリングのたびに参照する
+        self.thread_ids = thread_ids
+        self.interval = interval_ms / 1000
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            for ident, depth in tuple(self.thread_ids.items()):
+                frame = frames.get(ident) if depth > 0 else None
+                if frame is None or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class SQLStats:
+    """
+    計測中のリクエストで実行されたSQLの回数と所要時間を集計する
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements = {}
+
+    def record(self, statement, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        entry = self.statements.setdefault(statement, {"statement": statement, "count": 0, "total_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += duration_ms
+
+    def to_dict(self):
+        statements = sorted(self.statements.values(), key=lambda entry: entry["total_ms"], reverse=True)
+        return {"count": self.count, "total_ms": round(self.total_ms, 3), "statements": statements}
+
+
+class ProfileSession:
+    """
+    計測中のリクエストのSQL統計と、処理を実行中のスレッド（スレッドID → 実行中の処理数）
+    """
+
+    def __init__(self):
+        self.sql_stats = SQLStats()
+        self.thread_ids = Counter()
+
+    def enter_thread(self):
+        self.thread_ids[threading.get_ident()] += 1
+
+    def exit_thread(self):
+        ident = threading.get_ident()
+        self.thread_ids[ident] -= 1
+        if self.thread_ids[ident] <= 0:
+            del self.thread_ids[ident]
+
+
+@contextmanager
+def track_current_thread():
+    """
+    計測中のリクエストの処理を実行している間だけ、現在のスレッドをサンプリング対象にする
+    """
+    profile = _current_profile.get() if PROFILING_ENABLED else None
+    if profile is None:
+        yield
+        return
+    profile.enter_thread()
+    try:
+        yield
+    finally:
+        profile.exit_thread()
+
+
+def tracked(func):
+    """
+    スレッドプールで実行する処理を包み、実行中のスレッドをサンプリング対象にする
+    """
+    if not PROFILING_ENABLED:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with track_current_thread():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.enter_thread()
+        conn.info.setdefault("profiling_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is None or not conn.info.get("profiling_start"):
+        return
+    profile.exit_thread()
+    duration_ms = (time.perf_counter() - conn.info["profiling_start"].pop()) * 1000
+    profile.sql_stats.record(statement, duration_ms)
+
+
+def _handle_error(exception_context):
+    # SQLが失敗した場合は after_cursor_execute が呼ばれないため、ここで対象から外す
+    profile = _current_profile.get()
+    conn = exception_context.connection
+    if profile is None or conn is None or not conn.info.get("profiling_start"):
+        return
+    profile.exit_thread()
+    conn.info["profiling_start"].pop()
+
+
+def _should_profile(request):
+    profile_header = request.headers.get("X-Profile")
+    if PROFILING_TOKEN and profile_header and hmac.compare_digest(profile_header.encode("utf-8"), PROFILING_TOKEN.encode("utf-8")):
+        return True
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+
+def _request_id(request):
+    request_id = request.headers.get("X-Request-ID")
+    if request_id and REQUEST_ID_PATTERN.match(request_id):
+        return request_id
+    return uuid.uuid4().hex
+
+
+def _prune_profiles():
+    # ファイル数が PROFILING_MAX_FILES を超えたら、古いプロファイルから（.collapsed と .json をまとめて）削除する
+    newest = {}
+    for entry in os.scandir(PROFILING_DIR):
+        stem, suffix = os.path.splitext(entry.name)
+        if suffix in PROFILE_FILE_SUFFIXES:
+            newest[stem] = max(newest.get(stem, 0), entry.stat().st_mtime)
+    kept_files = 0
+    for stem in sorted(newest, key=newest.get, reverse=True):
+        files = [os.path.join(PROFILING_DIR, stem + suffix) for suffix in PROFILE_FILE_SUFFIXES]
+        files = [path for path in files if os.path.exists(path)]
+        if kept_files + len(files) <= PROFILING_MAX_FILES:
+            kept_files += len(files)
+            continue
+        for path in files:
+            os.remove(path)
+
+
+def _save_profile(request_id, sampler, report):
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    with open(os.path.join(PROFILING_DIR, f"{request_id}.collapsed"), "w", encoding="utf-8") as f:
+        f.write(sampler.collapsed())
+    with open(os.path.join(PROFILING_DIR, f"{request_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    _prune_profiles()
+
+
+def _track_sync_endpoints(app):
+    # 同期エンドポイントはスレッドプールで実行されるため、実行中のスレッドをサンプリング対象にする
+    for route in app.router.routes:
+        if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = tracked(route.dependant.call)
+
+
+async def profile_request(request, call_next):
+    if not _should_profile(request) or not _profile_lock.acquire(blocking=False):
+        return await call_next(request)
+
+    request_id = _request_id(request)
+    profile = ProfileSession()
+    # ミドルウェアとエンドポイントの非同期処理はイベントループのスレッドで動く（他のリクエストと共有）
+    profile.enter_thread()
+    sampler = StackSampler(profile.thread_ids)
+    token = _current_profile.set(profile)
+    start = time.perf_counter()
+    sampler.start()
+    status_code = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Profile-Id"] = request_id
+        return response
+    finally:
+        sampler.stop()
+        duration_ms = (time.perf_counter() - start) * 1000
+        _current_profile.reset(token)
+        _profile_lock.release()
+        report = {
+            "request_id": request_id,
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": status_code,
+            "duration_ms": round(duration_ms, 3),
+            "interval_ms": PROFILING_INTERVAL_MS,
+            "samples": sampler.samples,
+            "sql": profile.sql_stats.to_dict(),
+        }
+        try:
+            # ファイル書き込みでイベントループを止めないようスレッドプールで保存する
+            await run_in_threadpool(_save_profile, request_id, sampler, report)
+            logger.info(f"Saved request profile {request_id} ({request.method} {request.url.path})")
+        except OSError as e:
+            logger.error(f"Failed to save request profile {request_id}: {e}")
+
+
+def install_profiling(app, engines):
+    """
+    PROFILING_ENABLED が有効な場合のみ、プロファイル用ミドルウェアとSQLイベントを登録する
+    """
+    if not PROFILING_ENABLED:
+        return
+    for engine in set(engines):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    app.middleware("http")(profile_request)
+    # エンドポイントはこの後で登録されるため、起動時に同期エンドポイントを包む
+    app.router.on_startup.append(lambda: _track_sync_endpoints(app))
+    logger.info("Request profiling enabled.")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, conlist
 from typing import Optional, List
 from datetime import date
 
@@ -65,6 +65,17 @@ class MatchingInformation(BaseModel):
     class Config:
         from_attributes = True
         
+# 一括オファー操作のスキーマ
+# 1回の一括操作で指定できるマッチングIDの上限
+MAX_BULK_OFFER_IDS = 100
+
+class BulkOfferRequest(BaseModel):
+    matching_ids: conlist(int, min_items=1, max_items=MAX_BULK_OFFER_IDS)
+
+class BulkOfferResult(BaseModel):
+    matching_id: int
+    updated: bool
+
 # Project Info
 class ProjectInformation(BaseModel):
     project_id: int
@@ -102,6 +113,7 @@ class TokenData(BaseModel):
     
 # Matching Result スキーマ
 class MatchingResult(BaseModel):
+    matching_id: Optional[int] = None
     project_title: Optional[str] = None
     matching_score: Optional[int] = None
     researcher_name: Optional[str] = None
@@ -0,0 +1,75 @@
+"""
+テスト共通の設定
+
+database.py はインポート時にエンジンを作成するため、アプリをインポートする前に
+プライマリ・レプリカの接続先を一時ディレクトリ内の2つのSQLiteファイルに設定する。
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'primary.db')}"
+os.environ["READER_DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'replica.db')}"
+os.environ["SECRET_KEY"] = "test-secret"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import crud, database, main, models  # noqa: E402
+
+PASSWORD = "password"
+_password_hash = crud.pwd_context.hash(PASSWORD)
+
+
+def reset_databases():
+    for bind in (database.engine, database.reader_engine):
+        models.Base.metadata.drop_all(bind=bind)
+        models.Base.metadata.create_all(bind=bind)
+
+
+def seed(session_factory, project_title, request):
+    """
+    顧客2名・研究者2名と、顧客1のプロジェクト1件、研究者1とのマッチング2件を登録する
+    """
+    with session_factory() as db:
+        for n in (1, 2):
+            suffix = "" if n == 1 else str(n)
+            db.add(models.CustomerInformation(
+                customer_id=n, customer_name="顧客", company_name="会社", department="部署",
+                email_address=f"customer{suffix}@example.com", password=_password_hash
+            ))
+            db.add(models.ResearcherInformation(
+                researcher_id=n, researcher_name="研究者",
+                email_address=f"researcher{suffix}@example.com", password=_password_hash
+            ))
+        db.add(models.ProjectInformation(
+            project_id=1, consultation_category="カテゴリ", project_title=project_title,
+            consultation_content="相談内容", customer_id=1
+        ))
+        for matching_id in (1, 2):
+            db.add(models.MatchingInformation(
+                matching_id=matching_id, project_id=1, researcher_id=1, matching_score=80,
+                request=request, response=False, offer_status=request, resolution=False
+            ))
+        db.commit()
+
+
+def login(client, kind, n=1):
+    suffix = "" if n == 1 else str(n)
+    response = client.post(
+        f"/{kind}s/login", json={"email_address": f"{kind}{suffix}@example.com", "password": PASSWORD}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def client():
+    reset_databases()
+    # レプリカにはオファー済みの状態を入れ、プライマリとの差分で読み先を判定する
+    seed(database.SessionLocal, "primary", request=False)
+    seed(database.ReaderSessionLocal, "replica", request=True)
+    # Cookie は Secure 属性付きのため https で接続する
+    return TestClient(main.app, base_url="https://testserver")
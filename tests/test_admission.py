@@ -0,0 +1,136 @@
+"""
+マッチング処理のリミッター（admission.ConcurrencyLimiter）のテスト
+"""
+import asyncio
+import sys
+import types
+
+import pytest
+from fastapi import HTTPException
+
+import database
+from admission import ConcurrencyLimiter
+from conftest import login
+
+
+def _limiter(**kwargs):
+    options = {"max_concurrency": 1, "max_queue": 2, "max_per_key": 2, "queue_timeout": 1, "retry_after": 7}
+    options.update(kwargs)
+    return ConcurrencyLimiter(**options)
+
+
+def _assert_empty(limiter):
+    assert limiter.stats()["running"] == 0
+    assert limiter.stats()["queued"] == 0
+    assert not limiter._per_key
+    assert not limiter._waiters
+
+
+def test_rejects_with_retry_after_when_queue_is_full():
+    async def scenario():
+        limiter = _limiter()
+        release = asyncio.Event()
+
+        async def hold(key):
+            async with limiter.slot(key):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold(key)) for key in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await limiter.acquire("d")
+        release.set()
+        await asyncio.gather(*tasks)
+        return limiter, exc_info.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+    assert limiter.metrics["rejected_queue_full"] == 1
+    assert limiter.metrics["admitted"] == 3
+    _assert_empty(limiter)
+
+
+def test_rejects_customer_over_its_cap():
+    async def scenario():
+        limiter = _limiter(max_concurrency=2, max_per_key=1)
+        await limiter.acquire("a")
+        with pytest.raises(HTTPException) as exc_info:
+            await limiter.acquire("a")
+        # 他の顧客は影響を受けない
+        await limiter.acquire("b")
+        limiter.release("a")
+        limiter.release("b")
+        return limiter, exc_info.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert limiter.metrics["rejected_per_customer"] == 1
+    _assert_empty(limiter)
+
+
+def test_waiting_customers_are_served_round_robin():
+    async def scenario():
+        limiter = _limiter(max_queue=10, max_per_key=5)
+        order = []
+        release = asyncio.Event()
+
+        async def job(key, n):
+            async with limiter.slot(key):
+                order.append(f"{key}{n}")
+                if not release.is_set():
+                    await release.wait()
+
+        first = asyncio.create_task(job("x", 0))
+        await asyncio.sleep(0)
+        # 顧客aが先に3件並んでも、b・cが間に割り込む
+        tasks = [asyncio.create_task(job(key, n)) for key, n in (("a", 1), ("a", 2), ("a", 3), ("b", 1), ("c", 1))]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *tasks)
+        return limiter, order
+
+    limiter, order = asyncio.run(scenario())
+    assert order == ["x0", "a1", "b1", "c1", "a2", "a3"]
+    _assert_empty(limiter)
+
+
+def test_timeout_and_cancel_clean_up_waiters():
+    async def scenario():
+        limiter = _limiter(queue_timeout=0.05)
+        await limiter.acquire("holder")
+
+        with pytest.raises(HTTPException) as exc_info:
+            await limiter.acquire("a")
+        assert limiter.metrics["rejected_timeout"] == 1
+
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert dict(limiter._per_key) == {"holder": 1}
+        limiter.release("holder")
+        return limiter, exc_info.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+    _assert_empty(limiter)
+
+
+def test_match_researchers_releases_db_connection_while_matching(client, monkeypatch):
+    checked_out = []
+
+    def run_matching_algorithm(consultation_content):
+        # 待ち行列・ベクトル化の間はプールの接続を使っていないこと
+        checked_out.append(database.engine.pool.checkedout())
+        return [{"researcher_id": 2, "researcher_name": "研究者", "score": 90}]
+
+    monkeypatch.setitem(sys.modules, "matching", types.SimpleNamespace(run_matching_algorithm=run_matching_algorithm))
+    response = client.post("/api/projects/1/match-researchers", headers=login(client, "customer"))
+    assert response.status_code == 200
+    assert response.json()[0]["project_title"] == "primary"
+    assert checked_out == [0]
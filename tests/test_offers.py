@@ -0,0 +1,91 @@
+"""
+オファーの一括操作と単一受け入れAPIの状態遷移・所有者チェックのテスト
+"""
+import database, models
+from conftest import login
+
+
+def _matching(matching_id):
+    with database.SessionLocal() as db:
+        matching = db.get(models.MatchingInformation, matching_id)
+        return matching.request, matching.response, matching.offer_status, matching.resolution
+
+
+def test_request_accept_and_decline(client):
+    customer = login(client, "customer")
+    researcher = login(client, "researcher")
+
+    response = client.post("/customers/offers/request", json={"matching_ids": [1, 2, 99]}, headers=customer)
+    assert response.json() == [
+        {"matching_id": 1, "updated": True},
+        {"matching_id": 2, "updated": True},
+        {"matching_id": 99, "updated": False},
+    ]
+
+    assert client.post("/researchers/offers/accept", json={"matching_ids": [1]}, headers=researcher).json() == [
+        {"matching_id": 1, "updated": True}
+    ]
+    assert client.post("/researchers/offers/decline", json={"matching_ids": [2]}, headers=researcher).json() == [
+        {"matching_id": 2, "updated": True}
+    ]
+    assert _matching(1) == (True, True, True, False)
+    assert _matching(2) == (True, False, False, True)
+
+
+def test_declined_offer_cannot_be_accepted_or_requested_again(client):
+    customer = login(client, "customer")
+    researcher = login(client, "researcher")
+    client.post("/customers/offers/request", json={"matching_ids": [2]}, headers=customer)
+    client.post("/researchers/offers/decline", json={"matching_ids": [2]}, headers=researcher)
+
+    assert client.post("/researchers/accept-offer/2", headers=researcher).status_code == 404
+    assert client.post("/researchers/offers/accept", json={"matching_ids": [2]}, headers=researcher).json() == [
+        {"matching_id": 2, "updated": False}
+    ]
+    assert client.post("/customers/offers/request", json={"matching_ids": [2]}, headers=customer).json() == [
+        {"matching_id": 2, "updated": False}
+    ]
+    assert _matching(2) == (True, False, False, True)
+
+    # 辞退した案件は進行中の一覧にも届いている一覧にも出ない
+    assert client.get("/researchers/projects/filtered", headers=researcher).json() == []
+    assert client.get("/researchers/projects", headers=researcher).json() == []
+
+
+def test_single_accept_offer(client):
+    client.post("/customers/offers/request", json={"matching_ids": [1]}, headers=login(client, "customer"))
+    response = client.post("/researchers/accept-offer/1", headers=login(client, "researcher"))
+    assert response.status_code == 200
+    assert response.json()["response"] is True
+    assert _matching(1) == (True, True, True, False)
+
+
+def test_offers_are_limited_to_owner(client):
+    client.post("/customers/offers/request", json={"matching_ids": [1]}, headers=login(client, "customer"))
+
+    # 他の顧客のプロジェクトにはオファーできない
+    other_customer = login(client, "customer", 2)
+    assert client.post("/customers/offers/request", json={"matching_ids": [2]}, headers=other_customer).json() == [
+        {"matching_id": 2, "updated": False}
+    ]
+
+    # 他の研究者宛てのオファーは受け入れ・辞退できない
+    other_researcher = login(client, "researcher", 2)
+    assert client.post("/researchers/accept-offer/1", headers=other_researcher).status_code == 404
+    assert client.post("/researchers/offers/decline", json={"matching_ids": [1]}, headers=other_researcher).json() == [
+        {"matching_id": 1, "updated": False}
+    ]
+    assert _matching(1) == (True, False, True, False)
+    assert _matching(2) == (False, False, False, False)
+
+    # 研究者・顧客以外のアカウント種別では呼び出せない
+    assert client.post("/customers/offers/request", json={"matching_ids": [1]}, headers=other_researcher).status_code == 403
+    assert client.post("/researchers/accept-offer/1", headers=other_customer).status_code == 403
+
+
+def test_bulk_request_size_is_limited(client):
+    customer = login(client, "customer")
+    assert client.post("/customers/offers/request", json={"matching_ids": []}, headers=customer).status_code == 422
+    assert client.post(
+        "/customers/offers/request", json={"matching_ids": list(range(101))}, headers=customer
+    ).status_code == 422
@@ -0,0 +1,100 @@
+"""
+一覧APIのキーセットページングと絞り込みのテスト
+
+NULLのスコアや同じスコアを含むデータで全ページをたどり、行の抜けや重複がないことを確認する。
+"""
+from datetime import date
+
+import database, models
+from conftest import login
+
+# レプリカ（一覧APIの読み取り先）に追加するマッチングのスコア（seed済みの matching_id 1, 2 は 80）
+EXTRA_SCORES = [90, None, 80, 70, None, 90, 60, 80]
+
+
+def _seed_matchings():
+    with database.ReaderSessionLocal() as db:
+        for n, score in enumerate(EXTRA_SCORES, start=3):
+            db.add(models.ProjectInformation(
+                project_id=n, consultation_category="分野A" if n % 2 else "分野B", project_title=f"案件{n}",
+                consultation_content="相談内容", customer_id=1, deadline=date(2024, 1, n)
+            ))
+            db.add(models.MatchingInformation(
+                matching_id=n, project_id=n, researcher_id=1, matching_score=score,
+                request=True, response=False, offer_status=True, resolution=False
+            ))
+            # プロジェクト1のマッチング結果としても同じスコアの行を追加する
+            db.add(models.MatchingInformation(
+                matching_id=100 + n, project_id=1, researcher_id=2, matching_score=score,
+                request=False, response=False, offer_status=False, resolution=False
+            ))
+        db.commit()
+        rows = db.query(models.MatchingInformation.matching_id, models.MatchingInformation.matching_score).all()
+    return rows
+
+
+def _expected_order(rows):
+    # スコア降順（NULLは最後）・ID降順
+    return [
+        matching_id for matching_id, _ in sorted(
+            rows, key=lambda row: (row[1] is not None, row[1] or 0, row[0]), reverse=True
+        )
+    ]
+
+
+def _walk(client, url, headers):
+    ids, pages, cursor = [], 0, None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200
+        ids += [row["matching_id"] for row in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, pages
+
+
+def test_researcher_projects_walk_every_page(client):
+    rows = _seed_matchings()
+    expected = _expected_order([row for row in rows if row[0] < 100])
+    ids, pages = _walk(client, "/researchers/projects", login(client, "researcher"))
+    assert ids == expected
+    assert len(ids) == len(set(ids)) == len(EXTRA_SCORES) + 2
+    assert pages == 4
+
+
+def test_matching_results_walk_every_page(client):
+    rows = _seed_matchings()
+    expected = _expected_order([row for row in rows if row[0] in (1, 2) or row[0] > 100])
+    ids, _ = _walk(client, "/api/projects/1/matching", login(client, "customer"))
+    assert ids == expected
+    assert len(ids) == len(set(ids))
+
+
+def test_filters(client):
+    _seed_matchings()
+    researcher = login(client, "researcher")
+    rows = client.get("/researchers/projects", params={"min_score": 80}, headers=researcher).json()
+    assert sorted(row["matching_id"] for row in rows) == [1, 2, 3, 5, 8, 10]
+
+    rows = client.get(
+        "/researchers/projects",
+        params={"category": "分野A", "deadline_from": "2024-01-04", "deadline_to": "2024-01-09"},
+        headers=researcher
+    ).json()
+    assert sorted(row["matching_id"] for row in rows) == [5, 7, 9]
+
+
+def test_bad_cursor_and_empty_filtered_page(client):
+    customer = login(client, "customer")
+    assert client.get("/api/projects/1/matching", params={"cursor": "not-a-cursor"}, headers=customer).status_code == 400
+    assert client.get("/researchers/projects", params={"cursor": "e30="}, headers=login(client, "researcher")).status_code == 400
+
+    # 絞り込みで0件になった場合は空のページ、マッチング自体がない場合は404
+    response = client.get("/api/projects/1/matching", params={"min_score": 99}, headers=customer)
+    assert response.status_code == 200
+    assert response.json() == []
+    assert client.get("/api/projects/999/matching", headers=customer).status_code == 404
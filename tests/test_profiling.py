@@ -0,0 +1,76 @@
+"""
+リクエスト単位のプロファイラ（profiling.py）のテスト
+
+main.app はプロファイル無効の設定で読み込まれるため、ここでは小さなアプリに有効化して登録する。
+"""
+import json
+import os
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import profiling
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "token")
+    monkeypatch.setattr(profiling, "PROFILING_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILING_INTERVAL_MS", 1)
+    return tmp_path
+
+
+def test_pool_thread_is_tracked_only_while_running(enabled):
+    profile = profiling.ProfileSession()
+    token = profiling._current_profile.set(profile)
+    seen = []
+    try:
+        profiling.tracked(lambda: seen.append(dict(profile.thread_ids)))()
+    finally:
+        profiling._current_profile.reset(token)
+    assert seen == [{threading.get_ident(): 1}]
+    assert not profile.thread_ids
+
+
+def test_profiles_sync_endpoint_and_sql(enabled):
+    app = FastAPI()
+    engine = create_engine("sqlite://")
+    profiling.install_profiling(app, [engine])
+
+    @app.get("/slow")
+    def slow_endpoint():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        response = client.get("/slow", headers={"X-Profile": "token", "X-Request-ID": "req-1"})
+        assert response.headers["X-Profile-Id"] == "req-1"
+        # トークンが一致しないリクエストは計測しない
+        assert "X-Profile-Id" not in client.get("/slow", headers={"X-Profile": "wrong"}).headers
+
+    collapsed = (enabled / "req-1.collapsed").read_text(encoding="utf-8")
+    assert "test_profiling.py:slow_endpoint" in collapsed
+    assert "selectors.py:select " not in collapsed
+    report = json.loads((enabled / "req-1.json").read_text(encoding="utf-8"))
+    assert report["status_code"] == 200
+    assert report["sql"]["count"] == 1
+
+
+def test_old_profiles_are_pruned(enabled, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_MAX_FILES", 4)
+    for n in range(4):
+        for suffix in profiling.PROFILE_FILE_SUFFIXES:
+            path = enabled / f"req-{n}{suffix}"
+            path.write_text("", encoding="utf-8")
+            os.utime(path, (n, n))
+    profiling._prune_profiles()
+    assert sorted(os.listdir(enabled)) == ["req-2.collapsed", "req-2.json", "req-3.collapsed", "req-3.json"]
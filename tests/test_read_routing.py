@@ -0,0 +1,76 @@
+"""
+読み取り専用エンドポイントのレプリカ振り分けを、2つのSQLiteファイルで確認するテスト
+
+プライマリとレプリカに同じIDで内容の異なるデータを入れ、どちらから読まれたかを判定する。
+"""
+import sys
+import time
+import types
+
+from fastapi.testclient import TestClient
+
+import database, main
+from conftest import login
+
+
+def test_reader_engine_is_separate():
+    assert database.reader_engine is not database.engine
+
+
+def test_get_routes_read_from_replica(client):
+    assert client.get("/api/projects/1").json()["project_title"] == "replica"
+
+    headers = login(client, "researcher")
+    projects = client.get("/researchers/projects", headers=headers).json()
+    assert [project["project_title"] for project in projects] == ["replica", "replica"]
+
+    headers = login(client, "customer")
+    matching = client.get("/api/projects/1/matching", headers=headers).json()
+    assert [row["project_title"] for row in matching] == ["replica", "replica"]
+
+
+def test_recent_writer_reads_from_primary_with_header(client):
+    # クロスサイトのフロントエンドを想定し、Cookie を使わずヘッダーだけで期限を受け渡す
+    headers = login(client, "customer")
+    response = client.post("/customers/offers/request", json={"matching_ids": [1]}, headers=headers)
+    assert response.json() == [{"matching_id": 1, "updated": True}]
+    token = response.headers[database.READ_PRIMARY_HEADER]
+
+    other = TestClient(main.app, base_url="https://testserver")
+    assert other.get("/api/projects/1").json()["project_title"] == "replica"
+    assert other.get("/api/projects/1", headers={database.READ_PRIMARY_HEADER: token}).json()["project_title"] == "primary"
+
+
+def test_matching_results_right_after_match_researchers(client, monkeypatch):
+    def run_matching_algorithm(consultation_content):
+        return [{"researcher_id": 2, "researcher_name": "研究者", "score": 95}]
+
+    monkeypatch.setitem(sys.modules, "matching", types.SimpleNamespace(run_matching_algorithm=run_matching_algorithm))
+    headers = login(client, "customer")
+    response = client.post("/api/projects/1/match-researchers", headers=headers)
+    token = response.headers[database.READ_PRIMARY_HEADER]
+
+    # ヘッダーを付けた直後の読み取りは、レプリカ未反映の新しい結果もプライマリから返す
+    other = TestClient(main.app, base_url="https://testserver")
+    matching = other.get("/api/projects/1/matching", headers={**headers, database.READ_PRIMARY_HEADER: token}).json()
+    assert [row["matching_score"] for row in matching] == [95, 80, 80]
+    assert other.get("/api/projects/1/matching", headers=headers).json()[0]["project_title"] == "replica"
+
+
+def test_recent_writer_reads_from_primary_with_cookie(client):
+    response = client.post("/customers/offers/request", json={"matching_ids": [1]}, headers=login(client, "customer"))
+    cookie = response.headers["set-cookie"]
+    assert "Secure" in cookie
+    assert "SameSite=none" in cookie
+
+    # Cookie を保持しているクライアントはプライマリから読む
+    assert client.get("/api/projects/1").json()["project_title"] == "primary"
+
+
+def test_read_primary_token_is_signed_and_expires():
+    deadline = f"{time.time() + 60:.3f}"
+    assert database.should_read_primary(f"{deadline}.{database._sign_read_primary(deadline)}")
+    assert not database.should_read_primary(f"{deadline}.forged")
+
+    expired = f"{time.time() - 1:.3f}"
+    assert not database.should_read_primary(f"{expired}.{database._sign_read_primary(expired)}")